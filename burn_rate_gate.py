@@ -0,0 +1,60 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+class BurnRateGate:
+    """
+    Multi-window burn-rate gate for threshold alerts.
+    Every test outcome of a metric is recorded, and at most a `budget`
+    fraction of tests may cross the threshold. An alert fires only while
+    crossings consume that budget at least `threshold` times faster than
+    allowed in both the short and the long window, so isolated blips are
+    dropped. After firing, a metric stays silent until its short window
+    has recovered, so each incident alerts once instead of on every test.
+    """
+
+    def __init__(self, test_interval: float = 1200.0, short_window: float = 300.0,
+                 long_window: float = 3600.0, budget: float = 0.1, threshold: float = 2.0,
+                 maxlen: int = 1024):
+        self.test_interval = max(test_interval, 1.0)
+        # Each window has to span several tests for its rate to mean anything
+        self.short_window = max(short_window, 3 * test_interval)
+        self.long_window = max(long_window, 6 * test_interval)
+        self.budget = budget
+        self.threshold = threshold
+        self.maxlen = maxlen
+        self._tests: Dict[str, Deque[Tuple[float, bool]]] = {}
+        self._armed: Dict[str, bool] = {}
+
+    def _burn_rate(self, crossed: int, total: int, window: float) -> float:
+        # Until the window is full, count the tests it will hold so the
+        # first bad results after startup don't look like a 100% rate
+        expected = window / self.test_interval
+        return (crossed / max(total, expected)) / self.budget
+
+    def should_fire(self, metric: str, crossed: bool) -> bool:
+        """
+        Record one test outcome for metric.
+        Returns True if an alert should be sent for it.
+        """
+        now = time.monotonic()
+        tests = self._tests.setdefault(metric, deque(maxlen=self.maxlen))
+        tests.append((now, crossed))
+
+        # Forget tests that fell out of the long window
+        while tests and tests[0][0] <= now - self.long_window:
+            tests.popleft()
+
+        short = [c for t, c in tests if t > now - self.short_window]
+        short_burning = self._burn_rate(sum(short), len(short), self.short_window) >= self.threshold
+        long_burning = self._burn_rate(sum(c for _, c in tests), len(tests), self.long_window) >= self.threshold
+
+        # Re-arm once the metric has recovered
+        if not short_burning:
+            self._armed[metric] = True
+
+        if not (crossed and short_burning and long_burning and self._armed.get(metric, True)):
+            return False
+
+        self._armed[metric] = False
+        return True
@@ -1,11 +1,41 @@
 import configparser
 import os
 import logging
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Dict, Any, Tuple
+
+@dataclass
+class Config:
+    """Parsed configuration values, defaults match a freshly created config.ini."""
+    # Thresholds
+    download_speed: float = 50.0
+    upload_speed: float = 10.0
+    ping: float = 100.0
+    packet_loss: float = 1.0
+    # SMS
+    enabled: bool = True
+    chat_id: str = ''  # Changed from phone_number to chat_id for Telegram
+    provider: str = 'telegram'  # Default to Telegram
+    api_key: str = ''
+    # General
+    test_interval: int = 1200
+    jitter_range: int = 60
+    headless: bool = False
+    csv_batch_size: int = 1  # Results buffered before they are written to the CSV
+    cpu_affinity: int = -1  # CPU core to pin the monitor to on Linux, -1 disables pinning
+    nice: int = 0  # Added to the process niceness at startup
+
+# Section of config.ini each Config field is stored in
+_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    'Thresholds': ('download_speed', 'upload_speed', 'ping', 'packet_loss'),
+    'SMS': ('enabled', 'chat_id', 'provider', 'api_key'),
+    'General': ('test_interval', 'jitter_range', 'headless', 'csv_batch_size',
+                'cpu_affinity', 'nice')
+}
 
 class ConfigHandler:
     def __init__(self):
-        self.config = configparser.ConfigParser()
+        self.settings = Config()
         self.config_file = 'config.ini'
         self._ensure_config_exists()
         self.load_config()
@@ -13,67 +43,74 @@ class ConfigHandler:
     def _ensure_config_exists(self) -> None:
         """Create default config file if it doesn't exist."""
         if not os.path.exists(self.config_file):
-            self.config['Thresholds'] = {
-                'download_speed': '50',
-                'upload_speed': '10',
-                'ping': '100',
-                'packet_loss': '1.0'
-            }
-            self.config['SMS'] = {
-                'enabled': 'true',
-                'chat_id': '',  # Changed from phone_number to chat_id for Telegram
-                'provider': 'telegram',  # Default to Telegram
-                'api_key': ''
-            }
-            self.config['General'] = {
-                'test_interval': '1200',
-                'jitter_range': '60',
-                'headless': 'false'
-            }
+            self.settings = Config()
             self.save_config()
             logging.info("Created default config.ini file")
 
     def load_config(self) -> None:
-        """Load configuration from file."""
+        """Load configuration from file into the settings dataclass."""
         try:
-            self.config.read(self.config_file)
+            parser = configparser.ConfigParser()
+            parser.read(self.config_file)
+            defaults = Config()
+            getters = {
+                float: parser.getfloat,
+                int: parser.getint,
+                bool: parser.getboolean,
+                str: parser.get
+            }
+            values = {}
+            for section, keys in _SECTIONS.items():
+                for key in keys:
+                    default = getattr(defaults, key)
+                    values[key] = getters[type(default)](section, key, fallback=default)
+            self.settings = Config(**values)
             logging.info("Configuration loaded successfully")
         except Exception as e:
-            logging.error(f"Error loading configuration: {str(e)}")
+            logging.error("Error loading configuration: %s", e)
             raise
 
     def save_config(self) -> None:
         """Save current configuration to file."""
         try:
+            parser = configparser.ConfigParser()
+            for section, keys in _SECTIONS.items():
+                parser[section] = {}
+                for key in keys:
+                    value = getattr(self.settings, key)
+                    parser[section][key] = str(value).lower() if isinstance(value, bool) else str(value)
             with open(self.config_file, 'w') as f:
-                self.config.write(f)
+                parser.write(f)
             logging.info("Configuration saved successfully")
         except Exception as e:
-            logging.error(f"Error saving configuration: {str(e)}")
+            logging.error("Error saving configuration: %s", e)
             raise
 
     def get_thresholds(self) -> Dict[str, float]:
         """Get all threshold values."""
         return {
-            'download_speed': self.config.getfloat('Thresholds', 'download_speed'),
-            'upload_speed': self.config.getfloat('Thresholds', 'upload_speed'),
-            'ping': self.config.getfloat('Thresholds', 'ping'),
-            'packet_loss': self.config.getfloat('Thresholds', 'packet_loss')
+            'download_speed': self.settings.download_speed,
+            'upload_speed': self.settings.upload_speed,
+            'ping': self.settings.ping,
+            'packet_loss': self.settings.packet_loss
         }
 
     def get_sms_config(self) -> Dict[str, Any]:
         """Get SMS/messaging configuration."""
         return {
-            'enabled': self.config.getboolean('SMS', 'enabled'),
-            'chat_id': self.config.get('SMS', 'chat_id'),  # Changed from phone_number to chat_id
-            'provider': self.config.get('SMS', 'provider'),
-            'api_key': self.config.get('SMS', 'api_key')
+            'enabled': self.settings.enabled,
+            'chat_id': self.settings.chat_id,
+            'provider': self.settings.provider,
+            'api_key': self.settings.api_key
         }
 
     def get_general_config(self) -> Dict[str, Any]:
         """Get general configuration values."""
         return {
-            'test_interval': self.config.getint('General', 'test_interval'),
-            'jitter_range': self.config.getint('General', 'jitter_range'),
-            'headless': self.config.getboolean('General', 'headless')
+            'test_interval': self.settings.test_interval,
+            'jitter_range': self.settings.jitter_range,
+            'headless': self.settings.headless,
+            'csv_batch_size': self.settings.csv_batch_size,
+            'cpu_affinity': self.settings.cpu_affinity,
+            'nice': self.settings.nice
         }
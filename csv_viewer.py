@@ -1,46 +1,112 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from datetime import datetime
-import numpy as np
-import shutil
+import io
 import os
-import tempfile
 import logging
+import importlib.util
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+CSV_FILE = os.path.join('Data', 'network_metrics.csv')
+# Columns and column types of the metrics CSV as written by main.py
+CSV_COLUMNS = ['timestamp', 'download', 'upload', 'ping', 'isp', 'server_location', 'server_id']
+CSV_DTYPES = {
+    'download': 'float32',
+    'upload': 'float32',
+    'ping': 'float32',
+    'isp': 'string',
+    'server_location': 'string',
+    'server_id': 'int32'
+}
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Metrics measured in Mbps, everything else is in ms
+SPEED_METRICS = ('download', 'upload')
+# pyarrow is optional, it parses the CSV multithreaded when installed
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+# Longer histories are downsampled before plotting
+MAX_PLOT_POINTS = 2000
+
+def _lazy_imports():
+    """Import pandas, numpy and matplotlib on first use, they are slow to load."""
+    global pd, np, plt, mdates, FigureCanvasTkAgg, NavigationToolbar2Tk
+    import pandas as pd
+    import numpy as np
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+def read_metrics_csv(source, **kwargs):
+    """Read metrics CSV data with known column types and parsed timestamps."""
+    return pd.read_csv(
+        source,
+        engine=CSV_ENGINE,
+        dtype=CSV_DTYPES,
+        parse_dates=['timestamp'],
+        date_format=TIMESTAMP_FORMAT,
+        on_bad_lines='skip',
+        **kwargs
+    )
+
+def lttb_downsample(x, y, n_out):
+    """
+    Downsample a series to n_out points with Largest-Triangle-Three-Buckets.
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with the previous pick and the next bucket's average.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    # n_out - 2 buckets spanning all points except the first and last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    picked = np.empty(n_out, dtype=np.intp)
+    picked[0] = 0
+    picked[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+
+        areas = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        picked[i + 1] = a
+
+    return x[picked], y[picked]
+
 class CSVViewer:
     def __init__(self, root):
+        _lazy_imports()
         self.root = root
         self.root.title("Network Metrics Viewer")
         self.root.geometry("1000x600")
-        self.temp_csv = None
+        # Bytes of the append-only CSV that have been loaded so far
+        self._last_size = 0
 
         try:
             # Ensure Data directory exists
             if not os.path.exists('Data'):
                 raise FileNotFoundError("Data directory not found")
 
-            original_csv = os.path.join('Data', 'network_metrics.csv')
-            if not os.path.exists(original_csv):
-                raise FileNotFoundError(f"CSV file not found: {original_csv}")
+            if not os.path.exists(CSV_FILE):
+                raise FileNotFoundError(f"CSV file not found: {CSV_FILE}")
 
-            # Create a temporary copy of the CSV file
-            self.temp_csv = self.create_temp_copy()
-            logger.debug(f"Temporary file created at: {self.temp_csv}")
-            
-            # Load the CSV data from the temporary copy
-            self.df = pd.read_csv(self.temp_csv)
-            # Convert timestamp to datetime
-            self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+            # Load the CSV data straight from the file main.py appends to
+            self.df = self.read_new_rows()
+            if self.df is None:
+                raise ValueError(f"CSV file has no complete rows: {CSV_FILE}")
         except Exception as e:
-            logger.error(f"Initialization error: {str(e)}")
+            logger.error("Initialization error: %s", e)
             messagebox.showerror("Error", f"Failed to initialize: {str(e)}")
             self.root.destroy()
             return
@@ -70,7 +136,15 @@ class CSVViewer:
         self.refresh_button.grid(row=0, column=1, padx=5, pady=5, sticky=tk.E)
 
         # Create the figure and canvas
-        self.fig, self.ax = plt.subplots(figsize=(12, 6))
+        # Constrained layout keeps labels from being cut off on every draw
+        self.fig, self.ax = plt.subplots(figsize=(12, 6), layout='constrained')
+
+        # Create the line once, update_graph only swaps its data
+        (self._line,) = self.ax.plot([], [], marker='o')
+        self.ax.xaxis_date()
+        self.ax.set_xlabel('Time')
+        # Rotate x-axis labels for better readability
+        self.ax.tick_params(axis='x', labelrotation=45)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.main_frame)
         self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=2, padx=5, pady=5)
 
@@ -87,7 +161,15 @@ class CSVViewer:
 
         # Store the current annotation to remove it later
         self.current_annotation = None
+
+        # Statistics text per metric, only valid until the data changes
+        self._stats_cache = {}
+
+        # Clean copy of the axes used to blit the hover annotation
+        self._bg = None
         
+        # Refresh the blit background after every full redraw
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         # Connect the hover event instead of click
         self.canvas.mpl_connect('motion_notify_event', self.on_hover)
         # Connect scroll event for zooming
@@ -99,73 +181,66 @@ class CSVViewer:
         # Initial plot
         self.update_graph()
 
-    def create_temp_copy(self):
-        """Create a temporary copy of the CSV file."""
-        try:
-            original_csv = os.path.join('Data', 'network_metrics.csv')
-            if not os.path.exists(original_csv):
-                raise FileNotFoundError(f"Original CSV file not found: {original_csv}")
-            
-            # Create a unique temporary file name
-            temp_file = tempfile.NamedTemporaryFile(
-                prefix='network_metrics_',
-                suffix='.csv',
-                delete=False
-            )
-            temp_csv = temp_file.name
-            temp_file.close()  # Close the file so we can copy to it
-            
-            logger.debug(f"Copying {original_csv} to {temp_csv}")
-            shutil.copy2(original_csv, temp_csv)
-            
-            return temp_csv
-        except Exception as e:
-            logger.error(f"Error in create_temp_copy: {str(e)}")
-            raise Exception(f"Failed to create temporary copy: {str(e)}")
+    def read_new_rows(self):
+        """Read the complete rows appended to the CSV since the last load."""
+        with open(CSV_FILE, 'rb') as f:
+            f.seek(self._last_size)
+            tail = f.read()
+
+        # Leave a partially written last line for the next refresh
+        end = tail.rfind(b'\n') + 1
+        if not end:
+            return None
+        start = self._last_size
+        self._last_size += end
+
+        if start == 0:
+            return read_metrics_csv(io.BytesIO(tail[:end]))
+        return read_metrics_csv(io.BytesIO(tail[:end]), header=None, names=CSV_COLUMNS)
 
     def refresh_data(self):
-        """Refresh the data by creating a new temporary copy and updating the graph."""
+        """Refresh the data by loading rows appended since the last load and updating the graph."""
         try:
             logger.debug("Starting data refresh")
             
-            # Create a new temporary copy
-            new_temp_csv = self.create_temp_copy()
-            logger.debug(f"Created new temporary file: {new_temp_csv}")
-            
-            # Remove the old temporary file
-            if self.temp_csv and os.path.exists(self.temp_csv):
-                try:
-                    os.remove(self.temp_csv)
-                    logger.debug(f"Removed old temporary file: {self.temp_csv}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove old temp file: {str(e)}")
-            
-            # Update the temporary file reference
-            self.temp_csv = new_temp_csv
-            
-            # Reload the data
-            self.df = pd.read_csv(self.temp_csv)
-            self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+            size = os.path.getsize(CSV_FILE)
+            if size == self._last_size:
+                logger.debug("CSV file unchanged, nothing to refresh")
+                messagebox.showinfo("Success", "No new data since last refresh.")
+                return
+
+            if size < self._last_size:
+                # The file was truncated or replaced, reload it from scratch
+                logger.debug("CSV file shrank, reloading it completely")
+                self._last_size = 0
+                new_rows = self.read_new_rows()
+                if new_rows is None:
+                    raise ValueError(f"CSV file has no complete rows: {CSV_FILE}")
+                self.df = new_rows
+            else:
+                new_rows = self.read_new_rows()
+                if new_rows is None:
+                    logger.debug("No complete rows appended yet")
+                    messagebox.showinfo("Success", "No new data since last refresh.")
+                    return
+                logger.debug("Appending %d new rows", len(new_rows))
+                self.df = pd.concat([self.df, new_rows], ignore_index=True)
             
+            # Statistics must be recomputed for the new data
+            self._stats_cache.clear()
+
             # Update the graph
             self.update_graph()
             
             logger.debug("Data refresh completed successfully")
             messagebox.showinfo("Success", "Data refreshed successfully!")
         except Exception as e:
-            logger.error(f"Error in refresh_data: {str(e)}")
+            logger.error("Error in refresh_data: %s", e)
             messagebox.showerror("Error", f"Failed to refresh data: {str(e)}")
 
     def cleanup(self):
-        """Clean up temporary files before closing."""
-        try:
-            if self.temp_csv and os.path.exists(self.temp_csv):
-                os.remove(self.temp_csv)
-                logger.debug(f"Cleaned up temporary file: {self.temp_csv}")
-        except Exception as e:
-            logger.warning(f"Cleanup error: {str(e)}")
-        finally:
-            self.root.destroy()
+        """Close the viewer window."""
+        self.root.destroy()
 
     def on_scroll(self, event):
         if not event.inaxes:
@@ -190,37 +265,52 @@ class CSVViewer:
         self.ax.set_ylim([ydata - (ydata - cur_ylim[0]) * scale_factor,
                          ydata + (cur_ylim[1] - ydata) * scale_factor])
         
-        self.canvas.draw()
+        # Coalesce bursts of wheel events into a single redraw
+        self.canvas.draw_idle()
+
+    def on_draw(self, event):
+        """Cache the freshly drawn axes so hover updates can be blitted."""
+        self._bg = self.canvas.copy_from_bbox(self.ax.bbox)
+        if self.current_annotation:
+            self.ax.draw_artist(self.current_annotation)
+
+    def blit_annotation(self):
+        """Redraw only the hover annotation on top of the cached background."""
+        if self._bg is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._bg)
+        if self.current_annotation:
+            self.ax.draw_artist(self.current_annotation)
+        self.canvas.blit(self.ax.bbox)
 
     def on_hover(self, event):
         if event.inaxes != self.ax:
             if self.current_annotation:  # Remove annotation when mouse leaves the plot
                 self.current_annotation.remove()
                 self.current_annotation = None
-                self.canvas.draw()
+                self.blit_annotation()
             return
 
-        metric = self.metric_var.get()
-        x_data = self.df['timestamp'].values
-        y_data = self.df[metric].values
+        metric = self._metric_name
+        if not len(self._x_num):
+            return
 
         # Find the nearest point
-        x_hover = event.xdata
-        distances = np.abs(mdates.date2num(x_data) - x_hover)
-        nearest_idx = np.argmin(distances)
+        nearest_idx = self.nearest_index(event.xdata)
 
         # Remove previous annotation if it exists
         if self.current_annotation:
             self.current_annotation.remove()
 
         # Create new annotation
-        timestamp = pd.Timestamp(x_data[nearest_idx]).to_pydatetime()
-        value = y_data[nearest_idx]
-        unit = 'Mbps' if metric in ['download', 'upload'] else 'ms'
-        annotation_text = f'{timestamp.strftime("%Y-%m-%d %H:%M:%S")}\n{metric}: {value:.2f} {unit}'
+        timestamp = self.df['timestamp'].iat[nearest_idx]
+        x_value = self._x_num[nearest_idx]
+        value = self._y_cache[metric][nearest_idx]
+        annotation_text = f'{timestamp.strftime("%Y-%m-%d %H:%M:%S")}\n{metric}: {value:.2f} {self._unit}'
 
         # Get the display coordinates of the data point
-        display_coords = self.ax.transData.transform((mdates.date2num(timestamp), value))
+        display_coords = self.ax.transData.transform((x_value, value))
         
         # Get the figure boundaries
         bbox = self.ax.get_window_extent()
@@ -239,52 +329,75 @@ class CSVViewer:
         
         self.current_annotation = self.ax.annotate(
             annotation_text,
-            xy=(timestamp, value),
+            xy=(x_value, value),
             xytext=(x_offset, y_offset),
             textcoords='offset points',
             bbox=dict(boxstyle='round,pad=0.5', fc='yellow', alpha=1.0),
-            arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0')
+            arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0'),
+            animated=True
         )
 
-        self.canvas.draw()
+        self.blit_annotation()
+
+    def nearest_index(self, x_hover):
+        """Return the index of the sample closest to x_hover (timestamps are sorted)."""
+        i = np.searchsorted(self._x_num, x_hover)
+        if i >= len(self._x_num):
+            return len(self._x_num) - 1
+        if i > 0 and x_hover - self._x_num[i - 1] <= self._x_num[i] - x_hover:
+            return i - 1
+        return i
 
     def update_graph(self, event=None):
-        self.ax.clear()
         metric = self.metric_var.get()
+
+        # Cache the metric and its unit so on_hover doesn't query Tk
+        self._metric_name = metric
+        self._unit = 'Mbps' if metric in SPEED_METRICS else 'ms'
+
+        # Precompute the numeric x-axis and metric columns used by on_hover
+        self._x_num = mdates.date2num(self.df['timestamp'].values)
+        self._y_cache = {m: self.df[m].values for m in ('download', 'upload', 'ping')}
+
+        # Remove the hover annotation, it belongs to the previous data
+        if self.current_annotation:
+            self.current_annotation.remove()
+            self.current_annotation = None
         
         # Plot the data
-        self.ax.plot(self.df['timestamp'], self.df[metric], marker='o')
+        x_plot, y_plot = self._x_num, self._y_cache[metric]
+        if len(x_plot) > MAX_PLOT_POINTS:
+            # on_hover still searches the full series, only drawing is reduced
+            x_plot, y_plot = lttb_downsample(x_plot, y_plot, MAX_PLOT_POINTS)
+        self._line.set_data(x_plot, y_plot)
+        self.ax.relim()
+        self.ax.autoscale()
         
         # Customize the plot
         self.ax.set_title(f'{metric.capitalize()} Over Time')
-        self.ax.set_xlabel('Time')
-        self.ax.set_ylabel(f'{metric.capitalize()} {"(Mbps)" if metric in ["download", "upload"] else "(ms)"}')
+        self.ax.set_ylabel(f'{metric.capitalize()} ({self._unit})')
         
-        # Rotate x-axis labels for better readability
-        plt.xticks(rotation=45)
-        
-        # Adjust layout to prevent label cutoff
-        self.fig.tight_layout()
-        
-        # Reset the current annotation
-        self.current_annotation = None
-        
-        # Update the canvas
-        self.canvas.draw()
+        # Update the canvas once the event loop is idle
+        self.canvas.draw_idle()
 
         # Update statistics
         stats = self.calculate_statistics(metric)
         self.stats_label.config(text=stats)
 
     def calculate_statistics(self, metric):
-        data = self.df[metric]
+        if metric in self._stats_cache:
+            return self._stats_cache[metric]
+
+        summary = self.df[metric].agg(['mean', 'max', 'min', 'std'])
+        unit = 'Mbps' if metric in SPEED_METRICS else 'ms'
         stats = f"""
         Statistics for {metric}:
-        Average: {data.mean():.2f} {'Mbps' if metric in ['download', 'upload'] else 'ms'}
-        Maximum: {data.max():.2f} {'Mbps' if metric in ['download', 'upload'] else 'ms'}
-        Minimum: {data.min():.2f} {'Mbps' if metric in ['download', 'upload'] else 'ms'}
-        Standard Deviation: {data.std():.2f}
+        Average: {summary['mean']:.2f} {unit}
+        Maximum: {summary['max']:.2f} {unit}
+        Minimum: {summary['min']:.2f} {unit}
+        Standard Deviation: {summary['std']:.2f}
         """
+        self._stats_cache[metric] = stats
         return stats
 
 def main():
@@ -1,5 +1,6 @@
 import os
 import logging
+import importlib.util
 from typing import Dict, Any
 from config_handler import ConfigHandler
 
@@ -36,7 +37,7 @@ class FirstRunHandler:
         except Exception as e:
             status['success'] = False
             status['messages'].append(f"Error during initialization: {str(e)}")
-            logging.error(f"First run initialization error: {str(e)}")
+            logging.error("First run initialization error: %s", e)
 
         return status
 
@@ -81,12 +82,12 @@ class FirstRunHandler:
         required_packages = ['requests']  # Removed speedtest-cli since we're using local file
         
         for package in required_packages:
-            try:
-                __import__(package.replace('-', '_'))
+            # Locate the package without executing its top-level code
+            if importlib.util.find_spec(package.replace('-', '_')) is not None:
                 status['messages'].append(f"Package '{package}' is installed")
-            except ImportError:
+            else:
                 status['success'] = False
                 status['messages'].append(f"Missing required package: {package}")
-                logging.error(f"Missing required package: {package}")
+                logging.error("Missing required package: %s", package)
 
         return status
@@ -1,205 +1,302 @@
-import speedtest
 import time
-import csv
 import os
 import random
 import logging
+from functools import partial
 from datetime import datetime
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Callable, Dict, Any, Tuple
 
 from config_handler import ConfigHandler
 from sms_handler import SMSHandler
 from first_run import FirstRunHandler
+from metrics_writer import MetricsWriter
+from burn_rate_gate import BurnRateGate
 
-def console_print(message: str, config_handler: ConfigHandler) -> None:
-    """Print to console only if not in headless mode."""
-    if not config_handler.get_general_config()['headless']:
-        print(message)
+if TYPE_CHECKING:
+    import speedtest
+
+CSV_FILE = os.path.join('Data', 'network_metrics.csv')
+# Seconds between re-selecting the best speedtest server
+SERVER_REFRESH_INTERVAL = 3600
+
+# Result fields reported when a speed test fails, only the timestamp varies
+_ERROR_RESULT: Dict[str, Any] = {
+    'download': -1,
+    'upload': -1,
+    'ping': -1,
+    'isp': 'Error',
+    'server_location': 'Error',
+    'server_id': -1
+}
+
+_USER_AGENTS: Tuple[str, ...] = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+
+def emit(msg: str, printer: Callable[[str], None] = print, level: int = logging.INFO) -> None:
+    """Send one pre-formatted status line to both the log and the console."""
+    logging.log(level, "%s", msg)
+    printer(msg)
+
+def failed_result() -> Dict[str, Any]:
+    """Result reported for a speed test that could not complete."""
+    return {'timestamp': datetime.now().isoformat(sep=' ', timespec='seconds'), **_ERROR_RESULT}
 
 def get_random_user_agent() -> str:
-    agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
-        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    ]
-    return random.choice(agents)
-
-def perform_speed_test(config_handler: ConfigHandler, sms_handler: SMSHandler) -> Dict[str, Any]:
+    return random.choice(_USER_AGENTS)
+
+def measure_speed(st: 'speedtest.Speedtest', kind: str, max_tries: int = 2) -> float:
+    """
+    Run a download or upload test and return the speed in Mbps.
+    A suspiciously low result is retried on the next best nearby server,
+    at most max_tries measurements in total.
+    """
+    # Leave the stream count to speedtest-cli's defaults, which already use
+    # more parallel connections than a fixed low count would
+    if kind == 'download':
+        run = st.download
+    else:
+        # Generate upload data on the fly instead of holding it all in memory
+        run = partial(st.upload, pre_allocate=False)
+    speed = run() / 1_000_000
+
+    for attempt in range(1, max_tries):
+        if speed >= 0.1:
+            break
+        logging.warning("Suspicious %s speed detected, retrying on another server...", kind)
+        # Choose among the already known closest servers, skipping the current one
+        candidates = [s for s in st.closest if s['id'] != st.best['id']]
+        if candidates:
+            best_server = st.get_best_server(candidates)
+            logging.info("Switched to server: %s, %s", best_server['name'], best_server['country'])
+        time.sleep(attempt)
+        speed = run() / 1_000_000
+
+    return speed
+
+def perform_speed_test(st: 'speedtest.Speedtest', refresh_server: bool, sms_handler: SMSHandler,
+                       thresholds: Dict[str, float], alert_gate: BurnRateGate,
+                       printer: Callable[[str], None] = print) -> Dict[str, Any]:
+    # Alerts are collected during the test and sent as a single message
+    alert_messages = []
     try:
-        console_print("Starting speed test...", config_handler)
-        logging.info("Starting speed test...")
+        emit("Starting speed test...", printer)
         
-        # Get thresholds from config
-        thresholds = config_handler.get_thresholds()
+        # Unpack the thresholds used by the checks below
+        download_threshold = thresholds['download_speed']
+        upload_threshold = thresholds['upload_speed']
+        ping_threshold = thresholds['ping']
         
-        # Configure speedtest with custom settings
-        st = speedtest.Speedtest(secure=True)
+        # Rotate the user agent on the shared speedtest instance
         st.user_agent = get_random_user_agent()
         
-        console_print("Getting server list...", config_handler)
-        logging.info("Getting server list...")
-        best_server = st.get_best_server()
-        logging.info(f"Selected server: {best_server['name']}, {best_server['country']}")
-        console_print(f"Selected server: {best_server['name']}, {best_server['country']}", config_handler)
+        if refresh_server:
+            emit("Getting server list...", printer)
+            best_server = st.get_best_server()
+        else:
+            # Re-ping only the current server, this also measures this test's ping
+            best_server = st.get_best_server([st.best])
+        emit(f"Selected server: {best_server['name']}, {best_server['country']}", printer)
         
-        time.sleep(random.uniform(0.5, 1.5))
+        # Pause between test phases, drawn once for the whole test
+        phase_pause = random.uniform(0.5, 1.5)
+        time.sleep(phase_pause)
         
         # Test download speed
-        console_print("Testing download speed...", config_handler)
-        logging.info("Testing download speed...")
-        download_speed = st.download() / 1_000_000
-        if download_speed < thresholds['download_speed']:
-            sms_handler.send_alert(
+        emit("Testing download speed...", printer)
+        download_speed = measure_speed(st, 'download')
+        if alert_gate.should_fire('download', download_speed < download_threshold):
+            alert_messages.append(
                 f"Low download speed detected: {download_speed:.2f} Mbps "
-                f"(threshold: {thresholds['download_speed']} Mbps)"
+                f"(threshold: {download_threshold} Mbps)"
             )
         
-        # Verify download speed
-        if download_speed < 0.1:
-            logging.warning("Suspicious download speed detected, retrying...")
-            time.sleep(1)
-            download_speed = st.download() / 1_000_000
-        
-        time.sleep(random.uniform(0.5, 1.5))
+        time.sleep(phase_pause)
         
         # Test upload speed
-        console_print("Testing upload speed...", config_handler)
-        logging.info("Testing upload speed...")
-        upload_speed = st.upload() / 1_000_000
-        if upload_speed < thresholds['upload_speed']:
-            sms_handler.send_alert(
+        emit("Testing upload speed...", printer)
+        upload_speed = measure_speed(st, 'upload')
+        if alert_gate.should_fire('upload', upload_speed < upload_threshold):
+            alert_messages.append(
                 f"Low upload speed detected: {upload_speed:.2f} Mbps "
-                f"(threshold: {thresholds['upload_speed']} Mbps)"
+                f"(threshold: {upload_threshold} Mbps)"
             )
         
-        # Verify upload speed
-        if upload_speed < 0.1:
-            logging.warning("Suspicious upload speed detected, retrying...")
-            time.sleep(1)
-            upload_speed = st.upload() / 1_000_000
-        
         # Get ping/jitter and server info
         results = st.results
         ping = results.ping
         
         # Check ping threshold
-        if ping > thresholds['ping']:
-            sms_handler.send_alert(
+        if alert_gate.should_fire('ping', ping > ping_threshold):
+            alert_messages.append(
                 f"High ping detected: {ping:.2f} ms "
-                f"(threshold: {thresholds['ping']} ms)"
+                f"(threshold: {ping_threshold} ms)"
             )
         
         # Verify ping is reasonable
         if ping > 1000 or ping < 1:
             logging.warning("Suspicious ping detected, using previous server ping")
-            ping = best_server['latency']
+            ping = st.best['latency']
+        
+        # Validate the rounded values that get saved, a speed that rounds to 0.0 is a failed test
+        download_speed = round(download_speed, 2)
+        upload_speed = round(upload_speed, 2)
+        ping = round(ping, 2)
         
         test_results = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'download': round(download_speed, 2),
-            'upload': round(upload_speed, 2),
-            'ping': round(ping, 2),
+            'timestamp': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            'download': download_speed,
+            'upload': upload_speed,
+            'ping': ping,
             'isp': results.client['isp'],
             'server_location': f"{results.server['name']}, {results.server['country']}",
             'server_id': results.server['id']
         }
         
-        if all(v > 0 for v in [test_results['download'], test_results['upload'], test_results['ping']]):
-            console_print(f"Test completed successfully: Download: {test_results['download']} Mbps, "
-                       f"Upload: {test_results['upload']} Mbps, Ping: {test_results['ping']} ms", config_handler)
-            logging.info(f"Test completed successfully: Download: {test_results['download']} Mbps, "
-                        f"Upload: {test_results['upload']} Mbps, Ping: {test_results['ping']} ms")
+        if download_speed > 0 and upload_speed > 0 and ping > 0:
+            emit(f"Test completed successfully: Download: {download_speed} Mbps, "
+                 f"Upload: {upload_speed} Mbps, Ping: {ping} ms", printer)
             return test_results
         else:
             raise ValueError("Invalid speed test results detected")
             
     except Exception as e:
-        console_print(f"Error during speed test: {str(e)}", config_handler)
-        logging.error(f"Error during speed test: {str(e)}")
-        return {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'download': -1,
-            'upload': -1,
-            'ping': -1,
-            'isp': 'Error',
-            'server_location': 'Error',
-            'server_id': -1
-        }
+        emit(f"Error during speed test: {e}", printer, logging.ERROR)
+        return failed_result()
+    finally:
+        # One Telegram message per test, sent in the background
+        if len(alert_messages) == 1:
+            sms_handler.send_alert_async(alert_messages[0])
+        elif alert_messages:
+            sms_handler.send_alert_async(
+                f"{len(alert_messages)} thresholds crossed:\n" + "\n".join(alert_messages)
+            )
+
+def apply_cpu_settings(general_config: Dict[str, Any]) -> None:
+    """Pin the monitor to the configured CPU core and lower its priority."""
+    cpu = general_config['cpu_affinity']
+    # sched_setaffinity only exists on Linux
+    if cpu >= 0 and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+            logging.info("Pinned monitor to CPU %d", cpu)
+        except OSError as e:
+            logging.warning("Could not pin monitor to CPU %d: %s", cpu, e)
+
+    if general_config['nice'] and hasattr(os, 'nice'):
+        try:
+            os.nice(general_config['nice'])
+        except OSError as e:
+            logging.warning("Could not change process niceness: %s", e)
 
-def save_to_csv(data: Dict[str, Any], config_handler: ConfigHandler) -> None:
+def save_to_csv(metrics_writer: MetricsWriter, data: Dict[str, Any],
+                printer: Callable[[str], None] = print) -> None:
     try:
-        csv_file = os.path.join('Data', 'network_metrics.csv')
-        file_exists = os.path.exists(csv_file)
-        
-        fieldnames = ['timestamp', 'download', 'upload', 'ping', 'isp', 'server_location', 'server_id']
-        
-        with open(csv_file, 'a', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-                logging.info("Created new CSV file with headers")
-            writer.writerow(data)
+        if metrics_writer.write(data):
             logging.info("Successfully wrote data to CSV")
-            console_print(f"Data saved to {csv_file}", config_handler)
+            printer(f"Data saved to {CSV_FILE}")
+        else:
+            logging.info("Buffered result, %d rows pending", metrics_writer.pending)
             
     except Exception as e:
-        console_print(f"Error saving to CSV: {str(e)}", config_handler)
-        logging.error(f"Error saving to CSV: {str(e)}")
+        emit(f"Error saving to CSV: {e}", printer, logging.ERROR)
 
 def main() -> None:
     # Initialize configuration first to handle headless mode
     config_handler = ConfigHandler()
+    general_config = config_handler.get_general_config()
+
+    # Pick the console output once instead of checking headless on every line
+    printer = (lambda _msg: None) if general_config['headless'] else print
     
-    console_print("Starting Network Speed Monitor...", config_handler)
+    printer("Starting Network Speed Monitor...")
     
     # Initialize first run
     init_status = FirstRunHandler.initialize()
     if not init_status['success']:
-        console_print(f"Initialization failed: {init_status['messages']}", config_handler)
+        printer(f"Initialization failed: {init_status['messages']}")
         logging.error("Initialization failed")
         return
 
     # Check dependencies
     dep_status = FirstRunHandler.check_dependencies()
     if not dep_status['success']:
-        console_print(f"Dependency check failed: {dep_status['messages']}", config_handler)
+        printer(f"Dependency check failed: {dep_status['messages']}")
         logging.error("Dependency check failed")
         return
+
+    # Optional CPU pinning and priority, before any speedtest threads start
+    apply_cpu_settings(general_config)
     
     # Initialize SMS handler
     sms_handler = SMSHandler(config_handler.get_sms_config())
+    # Only alert on sustained threshold crossings, not on single bad tests
+    alert_gate = BurnRateGate(test_interval=general_config['test_interval'])
     
-    # Get general configuration
-    general_config = config_handler.get_general_config()
+    # Read the thresholds once, they don't change while monitoring
+    thresholds = config_handler.get_thresholds()
     
-    console_print("Network monitoring started", config_handler)
-    logging.info("Network monitoring started")
+    emit("Network monitoring started", printer)
     
+    # Keep the metrics file open for the lifetime of the monitor
+    metrics_writer = MetricsWriter(CSV_FILE, general_config['csv_batch_size'])
+
+    # Imported here so startup and the dependency check don't pay for it
+    import speedtest
+
+    # One speedtest instance is reused so its config and server list are fetched once
+    st = None
+    last_server_refresh = float('-inf')
+
+    # Tests are scheduled on fixed slots of the monotonic clock so the
+    # cadence doesn't drift by the duration of every test
+    next_slot = time.monotonic()
+
     while True:
         try:
             # Add configured jitter to the timing
             jitter = random.uniform(-general_config['jitter_range'], general_config['jitter_range'])
             
+            if st is None:
+                try:
+                    st = speedtest.Speedtest(secure=True)
+                    last_server_refresh = float('-inf')
+                except Exception as e:
+                    # Fetching the config failed, e.g. while offline, so take
+                    # the same 5 minute retry as any other failed test
+                    emit(f"Error during speed test: {e}", printer, logging.ERROR)
+            refresh_server = time.monotonic() - last_server_refresh > SERVER_REFRESH_INTERVAL
+            
             # Perform speed test and save results
-            results = perform_speed_test(config_handler, sms_handler)
+            if st is None:
+                results = failed_result()
+            else:
+                results = perform_speed_test(st, refresh_server, sms_handler, thresholds, alert_gate, printer)
             
+            now = time.monotonic()
             # Only save results if they're valid
             if results['download'] > 0:
-                save_to_csv(results, config_handler)
-                next_test = general_config['test_interval'] + jitter
+                save_to_csv(metrics_writer, results, printer)
+                if refresh_server:
+                    last_server_refresh = now
+                # Skip slots missed while a test ran longer than the interval
+                next_slot = max(next_slot + general_config['test_interval'], now)
+                next_deadline = next_slot + jitter
             else:
-                console_print("Invalid results detected, retrying in 5 minutes...", config_handler)
-                logging.warning("Invalid results detected, retrying in 5 minutes...")
-                next_test = 300  # 5 minutes
+                emit("Invalid results detected, retrying in 5 minutes...", printer, logging.WARNING)
+                next_slot = next_deadline = now + 300  # 5 minutes
+                # Start over with a fresh config and server list
+                st = None
             
-            console_print(f"Waiting approximately {next_test/60:.2f} minutes for next test", config_handler)
-            logging.info(f"Waiting approximately {next_test/60:.2f} minutes for next test")
-            time.sleep(next_test)
+            sleep_for = max(0.0, next_deadline - time.monotonic())
+            emit(f"Waiting approximately {sleep_for/60:.2f} minutes for next test", printer)
+            time.sleep(sleep_for)
             
         except Exception as e:
-            console_print(f"Error in main loop: {str(e)}", config_handler)
-            logging.error(f"Error in main loop: {str(e)}")
+            emit(f"Error in main loop: {e}", printer, logging.ERROR)
             time.sleep(60)  # Wait 1 minute before retrying
             continue
 
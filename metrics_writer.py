@@ -0,0 +1,59 @@
+import atexit
+import csv
+import os
+import logging
+from typing import Dict, Any, List, Tuple
+
+class MetricsWriter:
+    FIELDNAMES: Tuple[str, ...] = ('timestamp', 'download', 'upload', 'ping', 'isp', 'server_location', 'server_id')
+
+    def __init__(self, path: str, batch_size: int = 1):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._rows: List[Tuple[Any, ...]] = []
+        # The file stays open for the lifetime of the monitor
+        self._fp = open(path, 'a', newline='')
+        self._w = csv.writer(self._fp)
+        atexit.register(self.close)
+
+        if os.path.getsize(path) == 0:
+            self._w.writerow(self.FIELDNAMES)
+            self._fp.flush()
+            logging.info("Created new CSV file with headers")
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows not yet written to the file."""
+        return len(self._rows)
+
+    def write(self, data: Dict[str, Any]) -> bool:
+        """
+        Queue one speed test result and write the batch once it is full.
+        Returns True if the rows were flushed to the CSV file.
+        """
+        self._rows.append((
+            data['timestamp'],
+            data['download'],
+            data['upload'],
+            data['ping'],
+            data['isp'],
+            data['server_location'],
+            data['server_id']
+        ))
+        if len(self._rows) < self.batch_size:
+            return False
+        self.flush()
+        return True
+
+    def flush(self) -> None:
+        """Write all buffered rows to the CSV file."""
+        if self._rows:
+            self._w.writerows(self._rows)
+            self._rows.clear()
+        self._fp.flush()
+
+    def close(self) -> None:
+        """Flush buffered rows and close the file."""
+        if not self._fp.closed:
+            self.flush()
+            self._fp.close()
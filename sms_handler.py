@@ -1,13 +1,42 @@
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+    _dumps_json = orjson.dumps
+except ImportError:  # orjson is optional, fall back to the standard library
+    import json
+
+    def _dumps_json(obj: dict) -> bytes:
+        return json.dumps(obj).encode()
 
 class SMSHandler:
+    __slots__ = ('enabled', 'chat_id', 'provider', 'api_key', '_url', '_static_headers', '_session', '_executor')
+
     def __init__(self, config: dict):
         self.enabled = config['enabled']
         self.chat_id = config.get('chat_id', '')  # Telegram chat ID
         self.provider = config['provider']
         self.api_key = config['api_key']  # Telegram bot token
+        self._url = f"https://api.telegram.org/bot{self.api_key}/sendMessage"
+        self._static_headers = {"Content-Type": "application/json"}
+
+        # Reuse one keep-alive connection for all alerts
+        self._session = requests.Session()
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(['POST'])
+        )
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+
+        # Single background worker so alerts don't block the speed test
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alerts')
 
     def send_alert(self, message: str) -> bool:
         """
@@ -25,39 +54,45 @@ class SMSHandler:
         try:
             response = self._send_message(message)
             if response:
-                logging.info(f"Telegram alert sent successfully: {message}")
+                logging.info("Telegram alert sent successfully: %s", message)
                 return True
             return False
         except Exception as e:
-            logging.error(f"Error sending Telegram alert: {str(e)}")
+            logging.error("Error sending Telegram alert: %s", e)
             return False
 
+    def send_alert_async(self, message: str) -> Future:
+        """
+        Queue an alert to be sent in the background.
+        Returns a Future resolving to the result of send_alert.
+        """
+        return self._executor.submit(self.send_alert, message)
+
     def _send_message(self, message: str) -> Optional[bool]:
         """
         Send message using Telegram Bot API.
         """
         try:
             if self.provider.lower() != "telegram":
-                logging.error(f"Unsupported provider: {self.provider}")
+                logging.error("Unsupported provider: %s", self.provider)
                 return None
 
-            url = f"https://api.telegram.org/bot{self.api_key}/sendMessage"
-            data = {
+            body = _dumps_json({
                 "chat_id": self.chat_id,
                 "text": message,
                 "parse_mode": "HTML"  # Allows basic formatting
-            }
+            })
             
-            response = requests.post(url, json=data)
+            response = self._session.post(self._url, data=body, headers=self._static_headers, timeout=(3.05, 10))
             response_json = response.json()
             
             if response.status_code == 200 and response_json.get('ok'):
                 return True
             else:
                 error = response_json.get('description', 'Unknown error')
-                logging.error(f"Telegram API error: {error}")
+                logging.error("Telegram API error: %s", error)
                 return False
                 
         except Exception as e:
-            logging.error(f"Error in send_message: {str(e)}")
+            logging.error("Error in send_message: %s", e)
             return None